@@ -8,18 +8,19 @@ import logging
 import re
 import requests
 from report import *
+from rate_signals import *
+from message_cache import MessageCache
+from log_config import setup_logging
+from report_index import ReportIndex, parse_query, summarize, paginate, PENDING, PAGE_CHAR_LIMIT, LINE_CHAR_LIMIT
 import pdb
 
 # For Gemini automated moderation
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
-# Set up logging to the console
-logger = logging.getLogger('discord')
-logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
-handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-logger.addHandler(handler)
+# Set up logging to a rotating JSON log file (and warnings to the console), written from a background thread
+setup_logging()
+logger = logging.getLogger('modbot')
 
 # There should be a file called 'tokens.json' inside the same folder as this file
 token_path = 'tokens.json'
@@ -65,6 +66,21 @@ class ReportQueue:
         
         return None
 
+    def escalate(self, user_id):
+        '''
+        Moves every pending report against `user_id` to the top of the queue, keeping their relative order.
+        Returns the number of reports that were moved.
+        '''
+        escalated = []
+        for queue in [self.high_queue, self.med_queue, self.low_queue]:
+            escalated += [item for item in queue if item.reported_user_id == user_id]
+            queue[:] = [item for item in queue if item.reported_user_id != user_id]
+
+        for item in escalated:
+            item.priority = 'escalated'
+        self.high_queue[:0] = escalated
+        return len(escalated)
+
     def peek(self):
         if len(self.high_queue) > 0:
             return self.high_queue[0]
@@ -92,6 +108,8 @@ class ModCommands:
     NEXT = '\start next'
     COUNT = '\count'
     PREVIEW = '\preview'
+    SEARCH = '\search'
+    DOSSIER = '\dossier'
 
 class ModState(Enum):
     IDLE = auto()
@@ -106,10 +124,13 @@ class ModBot(discord.Client):
         self.group_num = None
         self.mod_channels = {} # Map from guild to the mod channel id for that guild
         self.reports = {} # Map from user IDs to the state of their report
+        self.message_cache = MessageCache() # Guild messages we've seen or fetched, shared by all reports
 
         self.queue = ReportQueue()
         self.false_report_history = {} # map from reporting user ids to list of false reports they have made
         self.report_history = {}  # Map from reported user IDs to list of the reports filed against them
+        self.rate_signals = RateSignals()  # Sliding-window message/flag/report counts per user and channel
+        self.report_index = ReportIndex()  # Secondary indexes over every queued report, for search and dossiers
 
         self.mod_mode = {}  # Map from user IDs to whether they are in mod mode
         self.mod_state = ModState.IDLE
@@ -156,10 +177,20 @@ class ModBot(discord.Client):
 
         # Check if this message was sent in a server ("guild") or if it's a DM
         if message.guild:
+            # Remember it so a later report on this message doesn't have to fetch it again
+            self.message_cache.put(message)
             await self.handle_channel_message(message)
         else:
             await self.handle_dm(message)
 
+    async def on_raw_message_edit(self, payload):
+        # The raw event fires for every edit, not just messages in discord.py's own cache.
+        # Drop our copy (and any context it's part of) so the next report fetches the current text.
+        self.message_cache.remove(payload.message_id)
+
+    async def on_raw_message_delete(self, payload):
+        self.message_cache.remove(payload.message_id)
+
     async def handle_dm(self, message):
         # Watch for the start of a mod flow
         if message.content.lower() == ModCommands.START:
@@ -213,7 +244,7 @@ class ModBot(discord.Client):
 
             # Add the report to the queue if it's valid
             if new_report.is_valid:
-                self.queue.add(new_report)
+                await self.add_report(new_report)
             
             # Prev Idea: Possibly add a tag for system action messages,
             # then have logic to send those messages to the public channel here?
@@ -234,6 +265,8 @@ class ModBot(discord.Client):
         if message.content.lower() == ModCommands.HELP:
             reply = f"Use the `{ModCommands.COUNT}` command to see how many reports are in the queue.\n"
             reply += f"Use the `{ModCommands.PREVIEW}` command to see the next report in the queue.\n"
+            reply += f"Use the `{ModCommands.SEARCH} key=value ...` command to search all reports. Filters: user, reporter, type (spam/harassment/offensive/threat), label, severity (pending/false/0-3), from/to (YYYY-MM-DD), page.\n"
+            reply += f"Use the `{ModCommands.DOSSIER} <user name or id> [page]` command to see a user's report history.\n"
             reply +=  f"Use the `{ModCommands.NEXT}` command to begin the moderation process on the next report in the queue.\n"
             reply += f"Use the `{ModCommands.END}` command to end the moderation process."
             return [reply]
@@ -247,6 +280,12 @@ class ModBot(discord.Client):
             if next_report is None:
                 return ["There are no reports in the queue."]
             return [f"Next report: {next_report.get_abuse_name()}, Priority: {next_report.priority}"]
+
+        if message.content.lower().startswith(ModCommands.SEARCH):
+            return self.search_reports(message.content[len(ModCommands.SEARCH):])
+
+        if message.content.lower().startswith(ModCommands.DOSSIER):
+            return self.user_dossier(message.content[len(ModCommands.DOSSIER):])
         
         if message.content.lower() == ModCommands.NEXT:
             next_report = self.queue.pop()
@@ -271,6 +310,9 @@ class ModBot(discord.Client):
             
             severity = message.content.lower()
             self.current_report.severity = severity
+            self.report_index.update_severity(self.current_report, severity)
+            logger.info("Report reviewed by %s", message.author.name,
+                        extra={'report_id': self.current_report.report_id, 'severity': severity, 'user_id': self.current_report.reported_user_id})
 
             # determine appropriate responses and system messages based on severity
             if severity == 'false':
@@ -340,12 +382,105 @@ class ModBot(discord.Client):
         return [f"Mod mode is currently enabled. Use the `{ModCommands.HELP}` command for more information."]
 
     
+    async def add_report(self, report):
+        '''
+        Adds a report to the queue and counts user reports towards the reported user's and channel's burst signals.
+        Reports against a user who is currently bursting go straight to the top of the queue.
+        '''
+        self.queue.add(report)
+        self.report_index.add(report)
+        logger.info("Report added to queue with priority %s", report.priority,
+                    extra={'report_id': report.report_id, 'message_id': report.reported_message.id if report.reported_message else None,
+                           'user_id': report.reported_user_id, 'channel_id': report.reported_channel_id})
+        # Auto mod reports were already counted as FLAGGED, so REPORTS only counts reports from users
+        if report.auto_label is None:
+            await self.record_signal(REPORTS, report.reported_user_id, report.reported_channel_id)
+        if self.rate_signals.is_bursting(report.reported_user_id):
+            self.queue.escalate(report.reported_user_id)
+
+
+    def search_reports(self, query):
+        '''
+        Handles the search command: filters every indexed report and returns one page of one-line summaries.
+        '''
+        kwargs, page, error = parse_query(query)
+        if error is not None:
+            return [error]
+
+        reports = self.report_index.search(**kwargs)
+        if not reports:
+            return ["No reports matched your search."]
+
+        body, page, num_pages = paginate([summarize(r) for r in reports], page)
+        return [f"Search results: {len(reports)} report(s), page {page}/{num_pages}\n```\n{body}\n```"]
+
+
+    def user_dossier(self, args):
+        '''
+        Handles the dossier command: a reported user's past reports and severities, and which of the
+        users who reported them have a history of false reports.
+        '''
+        args = args.split()
+        if len(args) == 0 or len(args) > 2 or (len(args) == 2 and not args[1].isdigit()):
+            return [f"Usage: `{ModCommands.DOSSIER} <user name or id> [page]`"]
+        page = int(args[1]) if len(args) == 2 else 1
+
+        reports = self.report_index.search(reported_user=args[0])
+        if not reports:
+            return [f"No reports have been filed against {args[0]}."]
+
+        severities = {}
+        false_reporters = {}
+        for r in reports:
+            severity = PENDING if r.severity is None else r.severity
+            severities[severity] = severities.get(severity, 0) + 1
+            if r.reporting_user in self.false_report_history:
+                false_reporters[r.reporting_user] = len(self.false_report_history[r.reporting_user])
+
+        header = f"DOSSIER: {reports[0].reported_user} (id: {reports[0].reported_user_id})\n"
+        header += f"Reports filed against them: {len(reports)} ("
+        header += ', '.join(f"{k}: {v}" for k, v in sorted(severities.items())) + ")\n"
+        header += f"Upheld reports in history: {len(self.report_history.get(reports[0].reported_user, []))}\n"
+        header += f"False reports they have made: {len(self.false_report_history.get(reports[0].reported_user, []))}\n"
+        if false_reporters:
+            header += "Reporters with false reports: " + ', '.join(f"{k} ({v})" for k, v in list(false_reporters.items())[:10]) + "\n"
+
+        body, page, num_pages = paginate([summarize(r) for r in reports], page, limit=max(PAGE_CHAR_LIMIT - len(header), LINE_CHAR_LIMIT))
+        return [f"{header}Page {page}/{num_pages}\n```\n{body}\n```"]
+
+
+    async def record_signal(self, signal, user_id, channel_id):
+        '''
+        Counts one message/flag/report event. If this pushes the user or channel over its threshold,
+        escalates the user's pending reports and posts a single burst alert to the mod channel.
+        '''
+        bursts = self.rate_signals.record(signal, user_id=user_id, channel_id=channel_id)
+        if not bursts:
+            return
+
+        window_minutes = self.rate_signals.window_seconds // 60
+        lines = []
+        for scope, key, burst_signal, count in bursts:
+            if scope == 'user':
+                escalated = self.queue.escalate(key)
+                lines.append(f"User id {key} reached {count} {burst_signal} in the last {window_minutes} minutes. {escalated} pending report(s) moved to the top of the queue.")
+            else:
+                lines.append(f"Channel id {key} reached {count} {burst_signal} in the last {window_minutes} minutes.")
+
+        alert = "\n".join(lines)
+        logger.warning("Burst alert: %s", alert, extra={'user_id': user_id, 'channel_id': channel_id})
+        mod_msg = ''.join(["BURST ALERT:\n",
+                           f"`{alert}`",
+                           "\n---------------------------------------\n---------------------------------------\n"])
+        await self.mod_channel.send(mod_msg)
+
+
     async def send_dm(self, user_id, msg):
         try:
             user = await client.fetch_user(user_id)
             await user.send(msg)
-        except Exception as e:
-            print(e)
+        except Exception:
+            logger.exception("Failed to send DM", extra={'user_id': user_id})
 
 
     async def handle_channel_message(self, message):
@@ -353,6 +488,8 @@ class ModBot(discord.Client):
         if not message.channel.name == f'group-{self.group_num}':
             return
 
+        await self.record_signal(MESSAGES, message.author.id, message.channel.id)
+
         # Review the message with the Gemini model
         prompt = "You are on a social media platform's moderation team. I need you to review the following content as if it were a tweet to determine if it contains harmful and/or extremist language. The content should not be repeated or generated. Please analyze the text and provide feedback on whether it includes any of the following categories of extremist language, and choose the one that fits best: 'Propaganda', 'Radicalization', 'Recruitment', or 'None'.\n\n"
         prompt += "Content to review:\n"
@@ -363,17 +500,22 @@ class ModBot(discord.Client):
 
         # The model returned an error, so forward that to the mod channel
         if "error" in model_review:
-            await mod_channel.send(f"Error: {model_review['error']}")
+            logger.error("Auto moderation failed: %s", model_review['error'], extra={'message_id': message.id, 'channel_id': message.channel.id})
+            await self.mod_channel.send(f"Error: {model_review['error']}")
             return
 
         # If the model returned "None", do nothing
         if model_review["Label"] == "None":
             return
 
+        await self.record_signal(FLAGGED, message.author.id, message.channel.id)
+
         # If the model returned a category, create a report
         new_report = Report(self)
         new_report.reported_user = message.author.name
         new_report.reported_user_id = message.author.id
+        new_report.reported_channel_id = message.channel.id
+        new_report.reported_message = message
         new_report.reported_content = message.content
         new_report.abuse_type = GenAbuseType.OFFENSIVE_CONTENT
         new_report.reporting_user = "Auto Mod"
@@ -387,7 +529,7 @@ class ModBot(discord.Client):
         elif model_review["Label"] == "Recruitment":
             new_report.extremist_type = ExtremistContentType.RECRUITMENT
         
-        self.queue.add(new_report)
+        await self.add_report(new_report)
         
         mod_msg = ''.join(["NEW REPORT:\n",
                             "A new report was generated and has been added to the queue:\n",
@@ -414,14 +556,15 @@ class ModBot(discord.Client):
             return res_json
         except:
             # If the response doesn't contain text, check if the prompt was blocked.
-            print(response.prompt_feedback)
+            logger.warning("Gemini review failed. Prompt feedback: %s", response.prompt_feedback)
             if len(response.candidates) > 0:
                 # Also check the finish reason to see if the response was blocked.
-                print(response.candidates[0].finish_reason)
                 # If the finish reason was SAFETY, the safety ratings have more details.
-                print(response.candidates[0].safety_ratings)
+                logger.warning("Gemini finish reason: %s, safety ratings: %s",
+                               response.candidates[0].finish_reason, response.candidates[0].safety_ratings)
             return {"error": str(response.prompt_feedback)}
 
 
 client = ModBot()
-client.run(discord_token)
\ No newline at end of file
+# Logging is already configured above, so don't let discord.py add its own handler
+client.run(discord_token, log_handler=None)
\ No newline at end of file
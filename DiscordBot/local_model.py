@@ -0,0 +1,45 @@
+import joblib
+import numpy as np
+
+MODEL_PATH = 'local_model.joblib'
+NONE_LABEL = 'None'
+
+
+def apply_threshold(probs, classes, threshold):
+    '''
+    Turns class probabilities into labels: 'None' unless the extremist score (1 - P(None)) reaches the
+    threshold, in which case the most likely of the extremist labels.
+    '''
+    classes = list(classes)
+    none_index = classes.index(NONE_LABEL)
+    extremist = [i for i in range(len(classes)) if i != none_index]
+
+    scores = 1 - probs[:, none_index]
+    best = np.array(extremist)[np.argmax(probs[:, extremist], axis=1)]
+    return np.where(scores >= threshold, np.array(classes)[best], NONE_LABEL)
+
+
+class LocalModel:
+    '''
+    A trained text pipeline together with the decision threshold it was tuned with.
+    Built and saved by data/train_local.py.
+    '''
+    def __init__(self, pipeline, threshold, name=None, stats=None):
+        self.pipeline = pipeline
+        self.threshold = threshold
+        self.name = name
+        self.stats = stats
+
+    def predict(self, texts):
+        '''
+        Returns one label ('Propaganda', 'Radicalization', 'Recruitment' or 'None') per text.
+        '''
+        probs = self.pipeline.predict_proba(texts)
+        return list(apply_threshold(probs, self.pipeline.classes_, self.threshold))
+
+
+def load_local_model(path=MODEL_PATH):
+    model = joblib.load(path)
+    if not isinstance(model, LocalModel):
+        raise Exception(f"{path} does not contain a LocalModel. Re-run data/train_local.py to rebuild it.")
+    return model
@@ -0,0 +1,146 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from datetime import datetime, timezone
+
+LOG_PATH = 'discord.log'
+MAX_BYTES = 10 * 1024 * 1024   # Roll the log over once it reaches 10 MB...
+ROTATE_SECONDS = 24 * 60 * 60  # ...or once a day, whichever comes first
+BACKUP_COUNT = 7
+
+# Per-subsystem log levels. Override at runtime with e.g. MODBOT_LOG_LEVELS="discord=DEBUG,modbot=DEBUG".
+# Overriding a logger also drops the defaults for its children, so discord=DEBUG includes gateway and HTTP tracing.
+DEFAULT_LEVELS = {
+    'discord': 'INFO',
+    'discord.gateway': 'WARNING',
+    'discord.http': 'WARNING',
+    'modbot': 'INFO',
+}
+LEVELS_ENV_VAR = 'MODBOT_LOG_LEVELS'
+
+# Attributes passed through `extra=` that get their own field in the JSON record
+STRUCTURED_FIELDS = ['report_id', 'message_id', 'user_id', 'channel_id', 'guild_id', 'severity']
+
+
+class JSONFormatter(logging.Formatter):
+    '''
+    Formats each record as a single line of JSON, so the log can be filtered by report or message id.
+    '''
+    def format(self, record):
+        out = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                out[field] = value
+        if record.exc_info:
+            out['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out['exception'] = record.exc_text
+        return json.dumps(out, default=str)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    '''
+    QueueHandler that keeps the traceback separate from the message. The default prepare() folds the
+    traceback into `msg` and drops exc_info, so the JSON record would never get an `exception` field.
+    The traceback is rendered to `exc_text` before the record is queued, so the queued record holds only plain data.
+    '''
+    def prepare(self, record):
+        exc_text = None
+        if record.exc_info:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+
+class SizeAndTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    '''
+    RotatingFileHandler that also rolls over after `interval` seconds, even if the size limit wasn't reached.
+    '''
+    def __init__(self, filename, max_bytes, interval, backup_count, encoding='utf-8'):
+        super().__init__(filename, mode='a', maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        self.interval = interval
+        self.rollover_at = time.time() + interval
+
+    def shouldRollover(self, record):
+        if time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+
+def parse_levels(text):
+    '''
+    Parses "logger=LEVEL,logger=LEVEL" into a dict. Returns (levels, invalid entries) so a typo in the
+    environment variable gets logged instead of stopping the bot from starting.
+    '''
+    levels = {}
+    invalid = []
+    for entry in text.split(','):
+        if not entry.strip():
+            continue
+        if '=' not in entry:
+            invalid.append(entry.strip())
+            continue
+        name, level = entry.split('=', 1)
+        level = level.strip().upper()
+        # getLevelName returns the level's number for known names and a "Level X" string otherwise
+        if not name.strip() or not isinstance(logging.getLevelName(level), int):
+            invalid.append(entry.strip())
+            continue
+        levels[name.strip()] = level
+    return levels, invalid
+
+
+def setup_logging(levels=None, path=LOG_PATH, max_bytes=MAX_BYTES, interval=ROTATE_SECONDS, backup_count=BACKUP_COUNT):
+    '''
+    Routes all logging through a QueueHandler so the event loop only ever does a non-blocking queue put.
+    A QueueListener thread does the actual formatting and disk writes. Returns the started listener.
+    '''
+    env_levels, invalid = parse_levels(os.environ.get(LEVELS_ENV_VAR, ''))
+    overrides = {**(levels or {}), **env_levels}
+    defaults = {name: level for name, level in DEFAULT_LEVELS.items()
+                if not any(name.startswith(parent + '.') for parent in overrides)}
+    levels = {**defaults, **overrides}
+
+    file_handler = SizeAndTimeRotatingFileHandler(path, max_bytes, interval, backup_count)
+    file_handler.setFormatter(JSONFormatter())
+
+    # Warnings and errors still show up on the console, like the prints they replace
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.WARNING)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(logging.WARNING)
+    root.addHandler(StructuredQueueHandler(log_queue))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # Flush whatever is still queued when the bot shuts down
+    atexit.register(listener.stop)
+
+    for entry in invalid:
+        logging.getLogger('modbot').warning("Ignoring invalid %s entry %r", LEVELS_ENV_VAR, entry)
+    return listener
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+import asyncio
+import time
+
+DEFAULT_MAX_MESSAGES = 2000
+DEFAULT_MAX_CONTEXTS = 200
+# Number of messages to pull from before and after a reported message. Set to 0 to skip fetching context.
+CONTEXT_MESSAGES = 3
+# Cached context is refetched after this long, so a report filed right after the message was posted
+# doesn't pin a short "after" half for every later report of the same message
+CONTEXT_TTL_SECONDS = 60
+
+
+class LRUCache:
+    '''
+    Small least-recently-used cache on top of OrderedDict. get and put are O(1).
+    '''
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+
+    def get(self, key):
+        if key not in self.items:
+            return None
+        self.items.move_to_end(key)
+        return self.items[key]
+
+    def put(self, key, value):
+        '''
+        Returns the (key, value) pair that was evicted to make room, or None.
+        '''
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.max_size:
+            return self.items.popitem(last=False)
+        return None
+
+    def pop(self, key):
+        return self.items.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+
+class MessageCache:
+    '''
+    Messages the bot has already seen or fetched, shared by every Report so that a message reported by
+    many users is only fetched from Discord once. Also caches the messages surrounding a reported message.
+    '''
+    def __init__(self, max_messages=DEFAULT_MAX_MESSAGES, max_contexts=DEFAULT_MAX_CONTEXTS):
+        self.messages = LRUCache(max_messages)  # Map from message ids to discord.Message
+        self.contexts = LRUCache(max_contexts)  # Map from message ids to (fetch time, messages before, messages after)
+        self.neighbours = {}                    # Map from message ids to the ids of cached contexts they appear in
+
+    def get(self, message_id):
+        return self.messages.get(message_id)
+
+    def put(self, message):
+        self.messages.put(message.id, message)
+
+    def remove(self, message_id):
+        '''
+        Drops an edited or deleted message, its own context and every cached context it appears in,
+        so the next report fetches them again.
+        '''
+        self.messages.pop(message_id)
+        self.remove_context(message_id)
+        for reported_id in self.neighbours.pop(message_id, set()):
+            self.remove_context(reported_id)
+
+    def remove_context(self, message_id):
+        entry = self.contexts.pop(message_id)
+        if entry is not None:
+            self.forget_neighbours(message_id, entry)
+
+    def forget_neighbours(self, message_id, entry):
+        _, before, after = entry
+        for m in before + after:
+            ids = self.neighbours.get(m.id)
+            if ids is not None:
+                ids.discard(message_id)
+                if not ids:
+                    del self.neighbours[m.id]
+
+    async def fetch(self, channel, message_id):
+        '''
+        Returns the message from the cache, or fetches it from the channel and caches it.
+        Raises discord.errors.NotFound like channel.fetch_message if it doesn't exist.
+        '''
+        message = self.get(message_id)
+        if message is None:
+            message = await channel.fetch_message(message_id)
+            self.put(message)
+        return message
+
+    async def fetch_context(self, message, limit=CONTEXT_MESSAGES):
+        '''
+        Returns (before, after): up to `limit` messages on each side of `message`, each oldest first.
+        The two history requests run concurrently and the result is cached per message for CONTEXT_TTL_SECONDS.
+        '''
+        if limit <= 0:
+            return [], []
+        entry = self.contexts.get(message.id)
+        if entry is not None:
+            fetched_at, before, after = entry
+            if time.monotonic() - fetched_at < CONTEXT_TTL_SECONDS:
+                return before, after
+            self.remove_context(message.id)
+
+        async def history(**kwargs):
+            return [m async for m in message.channel.history(limit=limit, **kwargs)]
+
+        before, after = await asyncio.gather(history(before=message), history(after=message, oldest_first=True))
+        before = list(reversed(before))
+        for m in before + after:
+            self.put(m)
+            self.neighbours.setdefault(m.id, set()).add(message.id)
+        self.put(message)
+
+        evicted = self.contexts.put(message.id, (time.monotonic(), before, after))
+        if evicted is not None:
+            self.forget_neighbours(*evicted)
+        return before, after
@@ -0,0 +1,143 @@
+import time
+
+# Signals we keep sliding-window counts for, per reported user and per channel
+MESSAGES = 'messages'
+FLAGGED = 'flagged'
+REPORTS = 'reports'
+
+# Default thresholds within one window. Crossing any of these escalates the user / alerts the mod channel.
+DEFAULT_WINDOW_SECONDS = 300
+DEFAULT_BUCKET_SECONDS = 5
+DEFAULT_USER_THRESHOLDS = {MESSAGES: 30, FLAGGED: 3, REPORTS: 3}
+DEFAULT_CHANNEL_THRESHOLDS = {MESSAGES: 200, FLAGGED: 10, REPORTS: 10}
+
+
+class SlidingWindowCounter:
+    '''
+    Counts events over the last `window_seconds` using a fixed ring of time buckets.
+    Adding an event and reading the total are both O(1): at most `num_buckets` stale
+    buckets are cleared when time moves forward, and that number is fixed up front.
+    '''
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS, bucket_seconds=DEFAULT_BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = max(1, window_seconds // bucket_seconds)
+        self.buckets = [0] * self.num_buckets
+        self.total = 0
+        self.last_tick = None
+
+    def advance(self, now):
+        tick = int(now // self.bucket_seconds)
+        if self.last_tick is None:
+            self.last_tick = tick
+            return
+        if tick <= self.last_tick:
+            return
+
+        # Clear every bucket that has fallen out of the window since the last event
+        for t in range(self.last_tick + 1, min(tick, self.last_tick + self.num_buckets) + 1):
+            i = t % self.num_buckets
+            self.total -= self.buckets[i]
+            self.buckets[i] = 0
+        self.last_tick = tick
+
+    def add(self, now, amount=1):
+        self.advance(now)
+        self.buckets[self.last_tick % self.num_buckets] += amount
+        self.total += amount
+        return self.total
+
+    def count(self, now):
+        self.advance(now)
+        return self.total
+
+
+class RateSignals:
+    '''
+    Keeps sliding-window counters of messages seen, flagged verdicts and reports received,
+    both per reported user and per channel. `record` returns the bursts that were just
+    detected so the caller can escalate the user and alert the mod channel once per burst.
+    '''
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS, bucket_seconds=DEFAULT_BUCKET_SECONDS,
+                 user_thresholds=None, channel_thresholds=None):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.user_thresholds = {**DEFAULT_USER_THRESHOLDS, **(user_thresholds or {})}
+        self.channel_thresholds = {**DEFAULT_CHANNEL_THRESHOLDS, **(channel_thresholds or {})}
+
+        self.user_counters = {}     # Map from user IDs to {signal: SlidingWindowCounter}
+        self.channel_counters = {}  # Map from channel IDs to {signal: SlidingWindowCounter}
+        self.last_alert = {}        # Map from ('user' | 'channel', id) to the time we last alerted on it
+        self.last_prune = None
+
+    def counter(self, counters, key, signal):
+        if key not in counters:
+            counters[key] = {}
+        if signal not in counters[key]:
+            counters[key][signal] = SlidingWindowCounter(self.window_seconds, self.bucket_seconds)
+        return counters[key][signal]
+
+    def check(self, scope, key, signal, count, threshold, now):
+        '''
+        Returns a burst tuple if `count` has reached `threshold` and we haven't already
+        alerted on this user/channel within the current window.
+        '''
+        if threshold is None or count < threshold:
+            return None
+        last = self.last_alert.get((scope, key))
+        if last is not None and now - last < self.window_seconds:
+            return None
+        self.last_alert[(scope, key)] = now
+        return (scope, key, signal, count)
+
+    def record(self, signal, user_id=None, channel_id=None, now=None):
+        '''
+        Counts one event of type `signal` against the user and/or channel.
+        Returns a (possibly empty) list of (scope, id, signal, count) bursts.
+        '''
+        if now is None:
+            now = time.monotonic()
+        if self.last_prune is None or now - self.last_prune >= self.window_seconds:
+            self.prune(now)
+
+        bursts = []
+        if user_id is not None:
+            count = self.counter(self.user_counters, user_id, signal).add(now)
+            burst = self.check('user', user_id, signal, count, self.user_thresholds.get(signal), now)
+            if burst:
+                bursts.append(burst)
+        if channel_id is not None:
+            count = self.counter(self.channel_counters, channel_id, signal).add(now)
+            burst = self.check('channel', channel_id, signal, count, self.channel_thresholds.get(signal), now)
+            if burst:
+                bursts.append(burst)
+        return bursts
+
+    def prune(self, now):
+        '''
+        Drops users/channels whose counters have all emptied and alerts that have expired, so one-off
+        authors don't keep a counter around forever. Runs at most once per window from `record`, so its
+        cost is spread over every event in that window.
+        '''
+        self.last_prune = now
+        for counters in [self.user_counters, self.channel_counters]:
+            idle = [key for key, signals in counters.items() if all(c.count(now) == 0 for c in signals.values())]
+            for key in idle:
+                del counters[key]
+        expired = [key for key, last in self.last_alert.items() if now - last >= self.window_seconds]
+        for key in expired:
+            del self.last_alert[key]
+
+    def is_bursting(self, user_id, now=None):
+        '''
+        Returns whether this user was escalated within the current window, so new reports
+        against them can go straight to the top of the queue as well.
+        '''
+        if now is None:
+            now = time.monotonic()
+        last = self.last_alert.get(('user', user_id))
+        return last is not None and now - last < self.window_seconds
+
+    def user_counts(self, user_id, now=None):
+        if now is None:
+            now = time.monotonic()
+        return {signal: c.count(now) for signal, c in self.user_counters.get(user_id, {}).items()}
@@ -1,4 +1,6 @@
 from enum import Enum, auto
+import itertools
+import asyncio
 import discord
 import re
 
@@ -43,12 +45,20 @@ class Report:
     START_KEYWORD = "\\report"
     CANCEL_KEYWORD = "\cancel"
     HELP_KEYWORD = "\help"
+    CONTEXT_LINE_LIMIT = 100
+    CONTEXT_CHAR_LIMIT = 400
+    id_counter = itertools.count(1)
 
     def __init__(self, client):
+        self.report_id = next(Report.id_counter)
+        self.created_at = None
         self.state = State.REPORT_START
         self.client = client
         self.message = None
         self.reported_message = None
+        self.context_task = None
+        self.context_before = []
+        self.context_after = []
         self.comment = None
         self.step = None
         self.abuse_type = None
@@ -60,6 +70,7 @@ class Report:
         self.reported_content = None
         self.reported_user = None
         self.reported_user_id = None
+        self.reported_channel_id = None
         self.reporting_user = None
         self.reporting_user_id = None
         self.block_reported_user = False
@@ -77,6 +88,7 @@ class Report:
         '''
 
         if message.content.lower() == self.CANCEL_KEYWORD:
+            self.cancel_context()
             self.is_valid = False
             self.state = State.REPORT_COMPLETE
             return ["Report cancelled."]
@@ -103,15 +115,20 @@ class Report:
             if not channel:
                 return ["It seems this channel was deleted or never existed. Please try again or say `cancel` to cancel."]
             try:
-                self.reported_message = await channel.fetch_message(int(m.group(3)))
+                # Messages the bot has already seen or that were reported before come from the shared cache
+                self.reported_message = await self.client.message_cache.fetch(channel, int(m.group(3)))
             except discord.errors.NotFound:
                 return ["It seems this message was deleted or never existed. Please try again or say `cancel` to cancel."]
 
+            # Pull the surrounding messages in the background while the user confirms
+            self.context_task = asyncio.create_task(self.client.message_cache.fetch_context(self.reported_message))
+
             # Here we've found the message - it's up to you to decide what to do next!
             self.state = State.CONFIRMATION_MESSAGE
             self.reported_content = self.reported_message.content
             self.reported_user = self.reported_message.author.name
             self.reported_user_id = self.reported_message.author.id
+            self.reported_channel_id = self.reported_message.channel.id
             return ["I found this message:", "```" + self.reported_message.author.name + ": " + self.reported_message.content + "```", 
                         "Is this the message you want to report? (yes/no)"]
 
@@ -121,10 +138,12 @@ class Report:
                 return ["Please respond with yes or no only."]
 
             if message.content.lower() == "no":
+                self.cancel_context()
                 self.state = State.AWAITING_MESSAGE
                 self.reported_content = None
                 self.reported_user = None
                 self.reported_user_id = None
+                self.reported_channel_id = None
                 return ["I'm sorry, please verify the link and try again?"]
 
             if message.content.lower() == "yes":
@@ -259,6 +278,7 @@ class Report:
                 return ["Please respond with yes or no only."]
             reply = "Thank you for completing this report.\n"
             reply += "Our content moderation team will review this post and decide on an appropriate action."
+            await self.collect_context()
             self.state = State.REPORT_COMPLETE
             if message.content.lower() == "yes":
                 self.block_reported_user = True
@@ -266,6 +286,32 @@ class Report:
             return [reply]
 
 
+    def cancel_context(self):
+        task = self.context_task
+        self.context_task = None
+        if task is None:
+            return
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            # Read the result so a failed fetch isn't logged as "Task exception was never retrieved"
+            task.exception()
+
+    async def collect_context(self):
+        '''
+        Waits for the background context fetch started when the message was found. By the time the user
+        has answered the report questions this has almost always finished already.
+        '''
+        task = self.context_task
+        self.context_task = None
+        if task is None or task.cancelled():
+            return
+        try:
+            self.context_before, self.context_after = await task
+        except discord.errors.HTTPException:
+            # Missing read history permissions etc. shouldn't stop the report from being filed
+            self.context_before, self.context_after = [], []
+
     def report_complete(self):
         return self.state == State.REPORT_COMPLETE
     
@@ -280,7 +326,7 @@ class Report:
             return "Imminent Safety Threat"
 
     def __str__(self):
-        out = "Report: \n"
+        out = f"Report #{self.report_id}: \n"
         out += f"Abuse type: {self.get_abuse_name()}\n"
         out += f"Reported User: {self.reported_user} (id: {self.reported_user_id})\n"
         out += f"Reported By: {self.reporting_user} (id: {self.reporting_user_id})\n"
@@ -289,7 +335,31 @@ class Report:
         out += f"Block Requested: {'Yes' if self.block_reported_user else 'No'}\n"
         out += f"Content: {self.reported_content}\n"
         out += f"Additional Comments: {self.comment}"
+        if self.context_before or self.context_after:
+            # Reports are sent to the mod channel in one message, so keep the context block short.
+            # Each side gets half the budget, filled with the messages nearest the reported one first.
+            budget = self.CONTEXT_CHAR_LIMIT // 2
+            before = self.context_lines(reversed(self.context_before), budget)[::-1]
+            after = self.context_lines(self.context_after, budget)
+            out += "\nSurrounding Messages:"
+            out += ''.join(before)
+            out += f"\n  >> {self.reported_user}: [reported message]"
+            out += ''.join(after)
         return out
     
+    def context_lines(self, messages, budget):
+        lines = []
+        used = 0
+        for m in messages:
+            content = m.content.replace('\n', ' ').replace('`', "'")
+            line = f"\n  {m.author.name}: {content}"
+            if len(line) > self.CONTEXT_LINE_LIMIT:
+                line = line[:self.CONTEXT_LINE_LIMIT - 3] + "..."
+            if used + len(line) > budget:
+                break
+            lines.append(line)
+            used += len(line)
+        return lines
+
     def stringified(self):
         return self.__str__()
@@ -0,0 +1,207 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from report import GenAbuseType
+
+# Discord rejects messages over 2000 characters, so leave some room for the page header
+PAGE_CHAR_LIMIT = 1800
+LINE_CHAR_LIMIT = 300
+PENDING = 'pending'
+
+ABUSE_TYPE_NAMES = {
+    'spam': GenAbuseType.SPAM,
+    'harassment': GenAbuseType.HARASSMENT,
+    'offensive': GenAbuseType.OFFENSIVE_CONTENT,
+    'threat': GenAbuseType.THREAT,
+}
+
+QUERY_FIELDS = ['user', 'reporter', 'type', 'label', 'severity', 'from', 'to', 'page']
+
+
+class ReportIndex:
+    '''
+    In-memory secondary indexes over every report that has been added to the queue, so moderators can
+    look reports up by reported user, reporter, abuse type, auto label, severity and date without
+    scanning the queue or history lists. Each index maps a key to the set of matching report ids.
+    '''
+    def __init__(self):
+        self.reports = {}           # Map from report ids to reports
+        self.by_reported_user = {}  # Map from reported user name / id to report ids
+        self.by_reporter = {}       # Map from reporting user name / id to report ids
+        self.by_abuse_type = {}     # Map from GenAbuseType to report ids
+        self.by_auto_label = {}     # Map from lowercased auto label to report ids
+        self.by_severity = {}       # Map from severity ('pending', 'false', '0' - '3') to report ids
+        self.severities = {}        # Map from report ids to the severity key they are indexed under
+        self.timeline = []          # (created_at, report id) in the order reports were added, which is chronological
+
+    def add_to(self, index, key, report_id):
+        if key is None:
+            return
+        if key not in index:
+            index[key] = set()
+        index[key].add(report_id)
+
+    def add(self, report):
+        if report.created_at is None:
+            report.created_at = datetime.now()
+        report_id = report.report_id
+        self.reports[report_id] = report
+
+        for key in user_keys(report.reported_user, report.reported_user_id):
+            self.add_to(self.by_reported_user, key, report_id)
+        for key in user_keys(report.reporting_user, report.reporting_user_id):
+            self.add_to(self.by_reporter, key, report_id)
+        self.add_to(self.by_abuse_type, report.abuse_type, report_id)
+        if report.auto_label is not None:
+            self.add_to(self.by_auto_label, report.auto_label.lower(), report_id)
+
+        severity = PENDING if report.severity is None else report.severity
+        self.add_to(self.by_severity, severity, report_id)
+        self.severities[report_id] = severity
+        self.timeline.append((report.created_at, report_id))
+
+    def update_severity(self, report, severity):
+        report_id = report.report_id
+        if report_id not in self.reports:
+            return
+        old = self.severities.get(report_id)
+        if old in self.by_severity:
+            self.by_severity[old].discard(report_id)
+        self.add_to(self.by_severity, severity, report_id)
+        self.severities[report_id] = severity
+
+    def in_range(self, start=None, end=None):
+        '''
+        Returns the ids of reports created in [start, end) using binary search over the timeline.
+        '''
+        lo = 0 if start is None else bisect_left(self.timeline, (start,))
+        hi = len(self.timeline) if end is None else bisect_left(self.timeline, (end,))
+        return {report_id for _, report_id in self.timeline[lo:hi]}
+
+    def search(self, reported_user=None, reporter=None, abuse_type=None, auto_label=None, severity=None, start=None, end=None):
+        '''
+        Returns the reports matching every given filter, newest first.
+        '''
+        candidates = []
+        if reported_user is not None:
+            candidates.append(self.by_reported_user.get(str(reported_user).lower(), set()))
+        if reporter is not None:
+            candidates.append(self.by_reporter.get(str(reporter).lower(), set()))
+        if abuse_type is not None:
+            candidates.append(self.by_abuse_type.get(abuse_type, set()))
+        if auto_label is not None:
+            candidates.append(self.by_auto_label.get(auto_label.lower(), set()))
+        if severity is not None:
+            candidates.append(self.by_severity.get(severity, set()))
+
+        if candidates:
+            # Intersect starting from the smallest set so the work is bounded by the most selective filter
+            candidates.sort(key=len)
+            ids = set(candidates[0])
+            for c in candidates[1:]:
+                ids &= c
+            if start is not None or end is not None:
+                ids = {i for i in ids if in_bounds(self.reports[i].created_at, start, end)}
+        else:
+            ids = self.in_range(start, end)
+
+        return sorted((self.reports[i] for i in ids), key=lambda r: (r.created_at, r.report_id), reverse=True)
+
+    def __len__(self):
+        return len(self.reports)
+
+
+def user_keys(name, user_id):
+    keys = []
+    if name is not None:
+        keys.append(str(name).lower())
+    if user_id is not None:
+        keys.append(str(user_id))
+    return keys
+
+
+def in_bounds(created_at, start, end):
+    if start is not None and created_at < start:
+        return False
+    if end is not None and created_at >= end:
+        return False
+    return True
+
+
+def parse_query(text):
+    '''
+    Parses `key=value` pairs (e.g. `user=bob severity=2 from=2024-05-01 page=2`) into search() keyword arguments.
+    Returns (kwargs, page, error); error is None if the query was valid.
+    '''
+    kwargs = {}
+    page = 1
+    for token in text.split():
+        if '=' not in token:
+            return None, None, f"Could not read `{token}`. Filters look like `key=value`."
+        key, value = token.split('=', 1)
+        key = key.lower()
+        if key not in QUERY_FIELDS:
+            return None, None, f"Unknown filter `{key}`. Options are: {', '.join(QUERY_FIELDS)}."
+
+        if key == 'user':
+            kwargs['reported_user'] = value
+        elif key == 'reporter':
+            kwargs['reporter'] = value
+        elif key == 'type':
+            if value.lower() not in ABUSE_TYPE_NAMES:
+                return None, None, f"Unknown type `{value}`. Options are: {', '.join(ABUSE_TYPE_NAMES)}."
+            kwargs['abuse_type'] = ABUSE_TYPE_NAMES[value.lower()]
+        elif key == 'label':
+            kwargs['auto_label'] = value
+        elif key == 'severity':
+            if value.lower() not in [PENDING, 'false', '0', '1', '2', '3']:
+                return None, None, f"Unknown severity `{value}`. Options are: {PENDING}, false, 0, 1, 2, 3."
+            kwargs['severity'] = value.lower()
+        elif key in ['from', 'to']:
+            try:
+                day = datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                return None, None, f"Dates should look like YYYY-MM-DD, not `{value}`."
+            # `to` is inclusive of the whole day
+            if key == 'from':
+                kwargs['start'] = day
+            else:
+                kwargs['end'] = day + timedelta(days=1)
+        elif key == 'page':
+            if not value.isdigit() or int(value) < 1:
+                return None, None, f"Page should be a positive number, not `{value}`."
+            page = int(value)
+
+    return kwargs, page, None
+
+
+def summarize(report):
+    '''
+    One-line summary of a report for search results.
+    '''
+    severity = PENDING if report.severity is None else report.severity
+    content = (report.reported_content or '').replace('\n', ' ').replace('`', "'")
+    line = f"#{report.report_id} {report.created_at:%Y-%m-%d %H:%M} | {report.get_abuse_name()}"
+    if report.auto_label is not None:
+        line += f" ({report.auto_label})"
+    line += f" | severity {severity} | {report.reported_user} <- {report.reporting_user} | {content}"
+    if len(line) > LINE_CHAR_LIMIT:
+        line = line[:LINE_CHAR_LIMIT - 3] + '...'
+    return line
+
+
+def paginate(lines, page, limit=PAGE_CHAR_LIMIT):
+    '''
+    Splits lines into pages of at most `limit` characters and returns (page text, page number, total pages).
+    The page number is clamped to the last page.
+    '''
+    pages = [[]]
+    size = 0
+    for line in lines:
+        if pages[-1] and size + len(line) + 1 > limit:
+            pages.append([])
+            size = 0
+        pages[-1].append(line)
+        size += len(line) + 1
+
+    page = min(page, len(pages))
+    return '\n'.join(pages[page - 1]), page, len(pages)
@@ -0,0 +1,279 @@
+"""
+Trains candidate local classifiers on the Seed and labelled eval data, sweeps their decision thresholds
+and ranks every configuration with the same binary stats and sub-confusion matrix as stats_*.json and
+sub_confusion_*.json.
+
+The corpus is split into train / validation / test. Models are fit on train, and the model and threshold
+are picked on validation. Only the chosen configuration is scored on the held-out test split, and those are
+the numbers written to stats_local.json / sub_confusion_local.json. Note that the test split is a fraction
+of the 1398-row eval set the gpt/gemini stats were computed on, so the numbers are not directly comparable.
+
+The best configuration is then refit on all the data and saved as a LocalModel (DiscordBot/local_model.py),
+which the bot can load with load_local_model() and call predict() on.
+
+Features are built once and cached in features_cache.joblib (rebuilt automatically if the data changes).
+Each candidate model is fit and swept in its own worker process.
+
+Usage:
+    python train_local.py [--workers N] [--rebuild] [--output ../DiscordBot/local_model.joblib]
+
+The MIWS csv only contains tweet ids (no text), so it can't be used for training here.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.naive_bayes import ComplementNB
+from sklearn.pipeline import Pipeline
+
+# The saved model and its decision rule live with the bot so it can load them without this script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'DiscordBot'))
+from local_model import LocalModel, apply_threshold
+
+SEED_PATHS = ['Seed_MIWS/Seed_Dataset/ISIS_Seed_Complete.csv', 'Seed_MIWS/Seed_Dataset/WS_Seed_Complete.csv']
+EVAL_PATH = 'eval_data_openai.json'
+CACHE_PATH = 'features_cache.joblib'
+MODEL_PATH = '../DiscordBot/local_model.joblib'
+
+LABELS = ['Propaganda', 'Radicalization', 'Recruitment', 'None']
+VECTORIZER_PARAMS = {'ngram_range': (1, 2), 'min_df': 2, 'sublinear_tf': True, 'strip_accents': 'unicode'}
+TEST_SIZE = 0.2
+VALIDATION_SIZE = 0.2  # Fraction of the whole corpus used to pick the model and threshold
+RANDOM_STATE = 152
+
+# Threshold on the extremist score (1 - P(None)) above which a message gets an extremist label
+THRESHOLDS = [round(t, 2) for t in np.arange(0.05, 0.96, 0.05)]
+
+CANDIDATES = {
+    'logreg_c0.5': lambda: LogisticRegression(C=0.5, class_weight='balanced', max_iter=2000),
+    'logreg_c2': lambda: LogisticRegression(C=2, class_weight='balanced', max_iter=2000),
+    'logreg_c8': lambda: LogisticRegression(C=8, class_weight='balanced', max_iter=2000),
+    'complement_nb_a0.1': lambda: ComplementNB(alpha=0.1),
+    'complement_nb_a0.5': lambda: ComplementNB(alpha=0.5),
+    'complement_nb_a1': lambda: ComplementNB(alpha=1.0),
+    'sgd_huber': lambda: SGDClassifier(loss='modified_huber', class_weight='balanced', random_state=RANDOM_STATE),
+}
+
+
+"""
+Loads the labelled corpus as parallel lists of texts and labels. The eval set already contains the Seed
+texts plus unlabelled tweets (label 'None'); the Seed csvs are read as well so any rows missing from the
+eval set are still included. Duplicate texts are kept once.
+"""
+def load_corpus():
+    texts = []
+    labels = []
+    seen = set()
+
+    def add(text, label):
+        text = text.strip()
+        if not text or text in seen or label not in LABELS:
+            return
+        seen.add(text)
+        texts.append(text)
+        labels.append(label)
+
+    with open(EVAL_PATH) as file:
+        data = json.load(file)
+    for inputs, label in zip(data['Inputs'], data['Labels']):
+        add(inputs[1]['content'], label)
+
+    for path in SEED_PATHS:
+        with open(path, encoding='latin-1') as file:
+            for row in csv.DictReader(file):
+                add(row['Text'], row['Label'])
+
+    return texts, labels
+
+
+"""
+Splits the corpus into train / validation / test, fits the TF-IDF vectorizer on the training split and
+caches the feature matrices. The cache is keyed on a hash of the corpus, split and vectorizer settings,
+so it is rebuilt when any of them change.
+"""
+def build_features(texts, labels, cache_path=CACHE_PATH, rebuild=False):
+    key = hashlib.sha256(json.dumps([texts, labels, repr(VECTORIZER_PARAMS), TEST_SIZE, VALIDATION_SIZE, RANDOM_STATE]).encode()).hexdigest()
+    if not rebuild and os.path.isfile(cache_path):
+        cached = joblib.load(cache_path)
+        if cached['key'] == key:
+            print(f"Loaded cached features from {cache_path}")
+            return cache_path
+
+    rest_texts, test_texts, y_rest, y_test = train_test_split(
+        texts, labels, test_size=TEST_SIZE, stratify=labels, random_state=RANDOM_STATE)
+    train_texts, val_texts, y_train, y_val = train_test_split(
+        rest_texts, y_rest, test_size=VALIDATION_SIZE / (1 - TEST_SIZE), stratify=y_rest, random_state=RANDOM_STATE)
+    vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS)
+    X_train = vectorizer.fit_transform(train_texts)
+    X_val = vectorizer.transform(val_texts)
+    X_test = vectorizer.transform(test_texts)
+
+    joblib.dump({
+        'key': key,
+        'X_train': X_train,
+        'X_val': X_val,
+        'X_test': X_test,
+        'y_train': np.array(y_train),
+        'y_val': np.array(y_val),
+        'y_test': np.array(y_test),
+    }, cache_path)
+    print(f"Built features ({X_train.shape[0]} train, {X_val.shape[0]} validation, {X_test.shape[0]} test, "
+          f"{X_train.shape[1]} terms) and cached them to {cache_path}")
+    return cache_path
+
+
+"""
+Same binary stats as the gpt/gemini stats in the notebook (extremist vs 'None').
+"""
+def binary_stats(actual, predicted):
+    n = len(actual)
+    actual_yes_mask = actual != 'None'
+    predicted_yes_mask = predicted != 'None'
+    tp = int(np.sum(actual_yes_mask & predicted_yes_mask))
+    tn = int(np.sum(~actual_yes_mask & ~predicted_yes_mask))
+    fp = int(np.sum(~actual_yes_mask & predicted_yes_mask))
+    fn = int(np.sum(actual_yes_mask & ~predicted_yes_mask))
+    predicted_no = tn + fn
+    predicted_yes = tp + fp
+    actual_no = tn + fp
+    actual_yes = fn + tp
+    return {
+        "tp": tp,
+        "tn": tn,
+        "fp": fp,
+        "fn": fn,
+        "predicted_no": predicted_no,
+        "predicted_yes": predicted_yes,
+        "actual_no": actual_no,
+        "actual_yes": actual_yes,
+        "accuracy": (tn + tp) / n,
+        "misclassification_rate": (fp + fn) / n,
+        "true_pos_rate": 0 if actual_yes == 0 else tp / actual_yes,
+        "false_pos_rate": 0 if actual_no == 0 else fp / actual_no,
+        "true_neg_rate": 0 if actual_no == 0 else tn / actual_no,
+        "precision": 0 if predicted_yes == 0 else tp / predicted_yes,
+        "prevalence": actual_yes / n,
+        "null_error_rate": actual_no / n,
+        "f1": 0 if tp == 0 else (2 * tp) / (2 * tp + fp + fn)
+    }
+
+
+"""
+Same sub confusion matrix as the notebook: rows for each actual extremist label, columns for every predicted label.
+"""
+def sub_confusion(actual, predicted):
+    confusion = {}
+    for a in LABELS[:-1]:
+        row = {}
+        for p in LABELS:
+            row[f"predicted_{p.lower()}"] = int(np.sum((actual == a) & (predicted == p)))
+        confusion[f"actual_{a.lower()}"] = row
+    return confusion
+
+
+"""
+Fraction of actually-extremist messages that got the right extremist label (the diagonal of the sub confusion matrix).
+"""
+def sub_accuracy(confusion):
+    correct = sum(confusion[f"actual_{a.lower()}"][f"predicted_{a.lower()}"] for a in LABELS[:-1])
+    total = sum(sum(row.values()) for row in confusion.values())
+    return 0 if total == 0 else correct / total
+
+
+def score(actual, predicted):
+    confusion = sub_confusion(actual, predicted)
+    return {
+        'stats': binary_stats(actual, predicted),
+        'sub_confusion_matrix': confusion,
+        'sub_accuracy': sub_accuracy(confusion),
+    }
+
+
+"""
+Worker: fits one candidate on the cached training features and scores every threshold on the validation split.
+The test split is scored too, but only the configuration picked on validation ever gets its test score reported.
+Reads the features from disk so only the cache path and candidate name are sent between processes.
+"""
+def evaluate_candidate(name, cache_path):
+    data = joblib.load(cache_path)
+    model = CANDIDATES[name]()
+    model.fit(data['X_train'], data['y_train'])
+    val_probs = model.predict_proba(data['X_val'])
+    test_probs = model.predict_proba(data['X_test'])
+
+    results = []
+    for threshold in THRESHOLDS:
+        results.append({
+            'model': name,
+            'threshold': threshold,
+            'validation': score(data['y_val'], apply_threshold(val_probs, model.classes_, threshold)),
+            'test': score(data['y_test'], apply_threshold(test_probs, model.classes_, threshold)),
+        })
+    return results
+
+
+def print_table(results, top):
+    print("Ranked on the validation split:")
+    print(f"{'rank':>4}  {'model':<20} {'thresh':>6} {'f1':>6} {'prec':>6} {'recall':>6} {'fpr':>6} {'acc':>6} {'sub_acc':>7}")
+    for rank, r in enumerate(results[:top], start=1):
+        s = r['validation']['stats']
+        print(f"{rank:>4}  {r['model']:<20} {r['threshold']:>6.2f} {s['f1']:>6.3f} {s['precision']:>6.3f} "
+              f"{s['true_pos_rate']:>6.3f} {s['false_pos_rate']:>6.3f} {s['accuracy']:>6.3f} {r['validation']['sub_accuracy']:>7.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and rank local extremist content classifiers.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (default: one per CPU)")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild the cached features even if they are up to date")
+    parser.add_argument('--output', default=MODEL_PATH, help="Where to save the best model")
+    parser.add_argument('--top', type=int, default=20, help="Number of configurations to show in the ranked table")
+    args = parser.parse_args()
+
+    texts, labels = load_corpus()
+    cache_path = build_features(texts, labels, rebuild=args.rebuild)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(evaluate_candidate, name, cache_path) for name in CANDIDATES]
+        for future in as_completed(futures):
+            results += future.result()
+
+    # Rank on validation f1 first, then on how well the extremist sub-labels were told apart.
+    # Model name and threshold break ties so the pick doesn't depend on which worker finished first.
+    results.sort(key=lambda r: (-r['validation']['stats']['f1'], -r['validation']['sub_accuracy'], r['model'], r['threshold']))
+    print_table(results, args.top)
+
+    best = results[0]
+    test = best['test']
+    evaluation = {
+        "model": best['model'],
+        "threshold": best['threshold'],
+        "tuned_on": "validation split",
+        "evaluated_on": "held-out test split",
+        "test_rows": test['stats']['tp'] + test['stats']['tn'] + test['stats']['fp'] + test['stats']['fn'],
+        "corpus_rows": len(texts),
+    }
+    with open("stats_local.json", "w") as file:
+        file.write(json.dumps({"local_stats": test['stats'], "evaluation": evaluation}, indent=4))
+    with open("sub_confusion_local.json", "w") as file:
+        file.write(json.dumps({"sub_confusion_matrix": test['sub_confusion_matrix'], "evaluation": evaluation}, indent=4))
+
+    # Refit the winning configuration on the whole corpus and save it with its threshold
+    pipeline = Pipeline([('tfidf', TfidfVectorizer(**VECTORIZER_PARAMS)), ('model', CANDIDATES[best['model']]())])
+    pipeline.fit(texts, labels)
+    joblib.dump(LocalModel(pipeline, best['threshold'], name=best['model'], stats=test['stats']), args.output)
+    print(f"\nBest: {best['model']} at threshold {best['threshold']} "
+          f"(test f1 {test['stats']['f1']:.3f} on {evaluation['test_rows']} held-out rows). Saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()